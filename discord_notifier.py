@@ -1,61 +1,84 @@
 import logging
 import os
-from datetime import datetime
+from collections.abc import Iterator
 
 import requests
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger(__name__)
 
-REGION_ORDER = [
-    "Ancient Rome",
-    "Ancient Greece",
-    "Europe",
-    "United States",
-]
-
 # Discord message character limit
 DISCORD_MAX_CHARS = 2000
 
+# Reused for every webhook call so the connection to discord.com stays warm
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
 
-def post_digest(date: datetime, events: list[dict], doc_url: str) -> None:
-    """Post a summary of today's events to Discord via webhook."""
-    webhook_url = os.environ["DISCORD_WEBHOOK_URL"]
 
-    day = date.day
-    month = date.strftime("%B")
-    year = date.year
-    date_str = f"{month} {day}, {year}"
+def post_digest(date_str: str, by_region: dict[str, list[dict]], doc_url: str) -> None:
+    """
+    Post a summary of today's events to Discord via webhook.
+    by_region maps each region to its events, in display order.
+    """
+    webhook_url = os.environ["DISCORD_WEBHOOK_URL"]
 
-    # Group events by region
-    by_region: dict[str, list[dict]] = {}
-    for event in events:
-        region = event.get("region", "")
-        by_region.setdefault(region, []).append(event)
+    footer = f"[Read the full digest →]({doc_url})"
+    # Room for everything before the footer, which is joined on with one newline
+    budget = DISCORD_MAX_CHARS - len(footer) - 1
 
     lines: list[str] = [f"**On This Day — {date_str}**\n"]
+    length = len(lines[0])
 
-    for region in REGION_ORDER:
-        region_events = by_region.get(region, [])
-        if not region_events:
+    # Stop adding whole lines once the next one would blow the Discord limit
+    # (shouldn't happen for ~10 events)
+    for block in _region_blocks(by_region):
+        kept = 0  # lines of this region's block added so far
+        for line in block:
+            if length + len(line) + 1 > budget:  # +1 for the joining newline
+                break
+            lines.append(line)
+            length += len(line) + 1
+            kept += 1
+        else:
             continue
 
-        lines.append(f"**{region}**")
-        for event in region_events:
-            title = event.get("title", "")
-            year_str = event.get("year", "")
-            teaser = event.get("teaser", "")
-            lines.append(f"• **{title}** ({year_str}) — {teaser}")
-        lines.append("")  # blank line between regions
-
-    lines.append(f"[Read the full digest →]({doc_url})")
+        logger.warning("Digest exceeds the Discord limit — truncating")
+        # Truncating needs a blank line before the footer: make room for it
+        if kept and length + 1 > budget:
+            length -= len(lines.pop()) + 1
+            kept -= 1
+        # Don't leave a region header with none of its events under it
+        if kept == 1:
+            length -= len(lines.pop()) + 1
+            kept = 0
+        # With nothing of this region kept, the message already ends in a
+        # blank line (the previous region's separator or the title's \n)
+        if kept:
+            lines.append("")
+        break
 
+    lines.append(footer)
     content = "\n".join(lines)
 
-    # Truncate if somehow we blow the Discord limit (shouldn't happen for ~10 events)
-    if len(content) > DISCORD_MAX_CHARS:
-        cutoff = content.rfind("\n", 0, DISCORD_MAX_CHARS - 60)
-        content = content[:cutoff] + f"\n\n[Read the full digest →]({doc_url})"
-
-    resp = requests.post(webhook_url, json={"content": content}, timeout=10)
+    resp = _session.post(webhook_url, json={"content": content}, timeout=10)
     resp.raise_for_status()
     logger.info("Posted digest to Discord")
+
+
+def _region_blocks(by_region: dict[str, list[dict]]) -> Iterator[list[str]]:
+    """
+    Yield the message body one region at a time: a bold header, its events,
+    then a blank separator line.
+    """
+    for region, region_events in by_region.items():
+        if not region_events:
+            continue
+
+        block = [f"**{region}**"]
+        for event in region_events:
+            title = event.get("title", "")
+            year_str = event.get("year", "")
+            teaser = event.get("teaser", "")
+            block.append(f"• **{title}** ({year_str}) — {teaser}")
+        block.append("")  # blank line between regions
+        yield block
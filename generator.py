@@ -1,12 +1,28 @@
 import os
 import json
+import functools
 import logging
-from datetime import datetime
+import re
+from collections.abc import Callable
 
 import anthropic
 
+try:
+    from orjson import loads as json_loads
+except ImportError:  # orjson is optional — fall back to the standard library parser
+    from json import loads as json_loads
+
 logger = logging.getLogger(__name__)
 
+# Regions Claude is asked to cover, in the order they appear in the doc and on Discord.
+# Must match the "region" values the prompt asks for.
+REGION_ORDER = [
+    "Ancient Rome",
+    "Ancient Greece",
+    "Europe",
+    "United States",
+]
+
 SYSTEM_PROMPT = """You are a historian and writer in the style of Dan Jones. Your writing is clear,
 grounded, and vivid without being dramatic. You focus on concrete human details, specific numbers,
 dates, and the texture of daily life. You avoid purple prose, sweeping generalizations, and
@@ -21,13 +37,78 @@ balance."
 You always return valid JSON and nothing else."""
 
 
-def generate_events(date: datetime) -> list[dict]:
-    """Call Claude to generate historical events for the given date. Returns a list of event dicts."""
-    client = anthropic.Anthropic(api_key=os.environ["ANTHROPIC_API_KEY"])
-
-    day = date.day
-    month = date.strftime("%B")
-    date_label = f"{month} {day}"
+# Matches a response wrapped in markdown code fences; group 1 is the content inside
+_FENCE_RE = re.compile(r"^\s*```[a-zA-Z]*\n(.*?)\n?```\s*$", re.DOTALL)
+
+
+@functools.cache
+def _get_client() -> anthropic.Anthropic:
+    """Build the Anthropic client once, so its HTTP connection pool is reused across calls."""
+    return anthropic.Anthropic(api_key=os.environ["ANTHROPIC_API_KEY"])
+
+
+class _EventStreamParser:
+    """
+    Pulls complete event objects out of the JSON as Claude streams it, so work on
+    each event can start before the rest of the response has been written.
+
+    Tracks nesting depth (ignoring braces inside strings) and emits every object
+    that closes at depth 3 — i.e. each item of the top-level "events" array.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = ""
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._start: int | None = None  # buffer offset of the event being read
+
+    def feed(self, chunk: str) -> list[dict]:
+        """Consume the next piece of streamed text; return any events it completed."""
+        offset = len(self._buffer)
+        self._buffer += chunk
+        events = []
+
+        for i, ch in enumerate(chunk, start=offset):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+                if self._depth == 3 and ch == "{":
+                    self._start = i
+            elif ch in "}]":
+                if self._depth == 3 and ch == "}" and self._start is not None:
+                    try:
+                        events.append(json_loads(self._buffer[self._start : i + 1]))
+                    except json.JSONDecodeError as e:
+                        # Not fatal — the full response is parsed again at the end
+                        logger.debug(f"Skipping unparseable streamed event: {e}")
+                    self._start = None
+                self._depth -= 1
+
+        return events
+
+
+def generate_events(
+    date_label: str,
+    on_event: Callable[[dict], None] | None = None,
+) -> list[dict]:
+    """
+    Call Claude to generate historical events for the given date (e.g. "March 15").
+    Returns a list of event dicts.
+
+    The response is streamed; if on_event is given, it is called with each event
+    as soon as that event's JSON object is complete, while Claude is still writing
+    the rest. The returned list is parsed from the full response and is authoritative.
+    """
+    client = _get_client()
 
     user_prompt = f"""Today is {date_label}. Generate a historical digest for this date.
 
@@ -63,24 +144,28 @@ Strict date rules — read carefully:
 
 Return only the JSON object. No markdown fences, no commentary."""
 
-    response = client.messages.create(
+    parser = _EventStreamParser()
+    with client.messages.stream(
         model="claude-sonnet-4-6",
         max_tokens=8000,
         system=SYSTEM_PROMPT,
         messages=[{"role": "user", "content": user_prompt}],
-    )
+    ) as stream:
+        for text in stream.text_stream:
+            if on_event:
+                for event in parser.feed(text):
+                    on_event(event)
+        response = stream.get_final_message()
 
     raw = response.content[0].text.strip()
 
     # Strip markdown code fences if Claude adds them anyway
-    if raw.startswith("```"):
-        lines = raw.split("\n")
-        raw = "\n".join(lines[1:])
-        if raw.endswith("```"):
-            raw = raw[: raw.rfind("```")]
+    fenced = _FENCE_RE.match(raw)
+    if fenced:
+        raw = fenced.group(1)
 
     try:
-        data = json.loads(raw)
+        data = json_loads(raw)
     except json.JSONDecodeError as e:
         logger.error(f"Failed to parse Claude response as JSON: {e}")
         logger.error(f"Raw response:\n{raw}")
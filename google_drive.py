@@ -1,20 +1,17 @@
+import functools
+import io
 import logging
 import os
-from datetime import datetime
+import re
 
+import httplib2
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request as GoogleRequest
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 
 logger = logging.getLogger(__name__)
 
-REGION_ORDER = [
-    "Ancient Rome",
-    "Ancient Greece",
-    "Europe",
-    "United States",
-]
-
 # ── Colour palette ────────────────────────────────────────────────────────────
 COLOR_H1    = {"red": 0.10, "green": 0.21, "blue": 0.42}  # deep navy
 COLOR_H2    = {"red": 0.38, "green": 0.12, "blue": 0.12}  # dark burgundy
@@ -24,8 +21,52 @@ COLOR_LINK  = {"red": 0.13, "green": 0.40, "blue": 0.67}  # steel blue
 IMAGE_WIDTH_PT  = 430
 IMAGE_HEIGHT_PT = 260
 
-
-def _get_services():
+# Keep each batchUpdate comfortably below the Docs API request-size limits
+BATCH_MAX_REQUESTS = 500
+
+
+# Blank line(s) between body paragraphs, absorbing stray spaces on either side
+_PARAS_RE = re.compile(r"[^\S\n]*\n\s*\n[^\S\n]*")
+
+
+def _pt(magnitude: float) -> dict:
+    return {"magnitude": magnitude, "unit": "PT"}
+
+
+# ── Style templates: (style, field mask) pairs, built once at import ──────────
+# Shared between requests — never mutate them.
+_TITLE_PARA = (
+    {"namedStyleType": "TITLE", "alignment": "CENTER", "spaceBelow": _pt(10)},
+    "namedStyleType,alignment,spaceBelow",
+)
+_H1_PARA = (
+    {"namedStyleType": "HEADING_1", "spaceAbove": _pt(20), "spaceBelow": _pt(6)},
+    "namedStyleType,spaceAbove,spaceBelow",
+)
+_H1_TEXT = ({"foregroundColor": {"color": {"rgbColor": COLOR_H1}}}, "foregroundColor")
+_H2_PARA = (
+    {"namedStyleType": "HEADING_2", "spaceAbove": _pt(16), "spaceBelow": _pt(4)},
+    "namedStyleType,spaceAbove,spaceBelow",
+)
+_H2_TEXT = ({"foregroundColor": {"color": {"rgbColor": COLOR_H2}}}, "foregroundColor")
+_IMAGE_PARA = (
+    {"alignment": "CENTER", "spaceAbove": _pt(10), "spaceBelow": _pt(14)},
+    "alignment,spaceAbove,spaceBelow",
+)
+_BODY_PARA = (
+    {"namedStyleType": "NORMAL_TEXT", "alignment": "JUSTIFIED", "spaceBelow": _pt(8)},
+    "namedStyleType,alignment,spaceBelow",
+)
+_LINK_PARA = (
+    {"namedStyleType": "NORMAL_TEXT", "spaceAbove": _pt(4), "spaceBelow": _pt(18)},
+    "namedStyleType,spaceAbove,spaceBelow",
+)
+_LINK_TEXT = {"foregroundColor": {"color": {"rgbColor": COLOR_LINK}}, "underline": True, "italic": True}
+_LINK_TEXT_FIELDS = "foregroundColor,italic,link,underline"
+
+
+@functools.lru_cache(maxsize=1)
+def _build_services():
     creds = Credentials(
         token=None,
         refresh_token=os.environ["GOOGLE_REFRESH_TOKEN"],
@@ -34,31 +75,35 @@ def _get_services():
         token_uri="https://oauth2.googleapis.com/token",
     )
     creds.refresh(GoogleRequest())
-    docs = build("docs", "v1", credentials=creds)
-    drive = build("drive", "v3", credentials=creds)
+    # Use the discovery documents bundled with google-api-python-client rather
+    # than fetching them from googleapis.com on every cold start
+    docs = build("docs", "v1", credentials=creds, static_discovery=True, cache_discovery=False)
+    drive = build("drive", "v3", credentials=creds, static_discovery=True, cache_discovery=False)
+    return docs, drive, creds
+
+
+def _get_services():
+    """
+    Return the (docs, drive) API clients. They are built once per process;
+    the access token is only refreshed again once it has expired.
+    """
+    docs, drive, creds = _build_services()
+    if creds.expired:
+        creds.refresh(GoogleRequest())
     return docs, drive
 
 
-def create_daily_doc(date: datetime, events: list[dict]) -> str:
+def create_blank_doc(date_str: str) -> str:
     """
-    Create a Google Doc containing the daily digest and return its shareable URL.
+    Create today's empty, link-shareable Google Doc and return its ID.
 
-    The document is built in four phases:
-      1. Assemble the full text and record where formatting + images should go.
-      2. Insert all text into the doc in one batchUpdate.
-      3. Apply paragraph and text styles in batched batchUpdates.
-      4. Insert images one at a time, working backwards through the document
-         so that each insertion does not shift the indices of remaining images.
+    Needs nothing but the date, so main.py runs it alongside the image lookups;
+    fill it afterwards with populate_doc().
     """
-    docs_service, drive_service = _get_services()
+    _, drive_service = _get_services()
 
-    day = date.day
-    month = date.strftime("%B")
-    year = date.year
-    date_str = f"{month} {day}, {year}"
     doc_title = f"On This Day — {date_str}"
 
-    # --- Create the blank document via Drive API ---
     # Using Drive's files.create is more reliable than docs.documents.create
     # and lets us set the parent folder in one call.
     folder_id = os.environ.get("GOOGLE_DRIVE_FOLDER_ID")
@@ -69,10 +114,12 @@ def create_daily_doc(date: datetime, events: list[dict]) -> str:
     if folder_id:
         file_metadata["parents"] = [folder_id]
 
+    # Shared-drive support is only needed when writing into a configured folder,
+    # which may live on a shared drive; My Drive doesn't need it
     drive_file = drive_service.files().create(
         body=file_metadata,
         fields="id",
-        supportsAllDrives=True,
+        supportsAllDrives=bool(folder_id),
     ).execute()
     doc_id = drive_file["id"]
     logger.info(f"Created Google Doc via Drive API: {doc_id}")
@@ -81,251 +128,224 @@ def create_daily_doc(date: datetime, events: list[dict]) -> str:
     drive_service.permissions().create(
         fileId=doc_id,
         body={"type": "anyone", "role": "reader"},
-        supportsAllDrives=True,
+        fields="id",
+        supportsAllDrives=bool(folder_id),
     ).execute()
 
-    # --- Build and populate the document ---
-    _build_document(docs_service, doc_id, date_str, events)
+    return doc_id
 
-    return f"https://docs.google.com/document/d/{doc_id}/edit"
 
+def populate_doc(doc_id: str, date_str: str, by_region: dict[str, list[dict]]) -> str:
+    """
+    Fill a blank doc from create_blank_doc() with the daily digest and return
+    its shareable URL. by_region maps each region to its events, in display order.
 
-def _build_document(docs_service, doc_id: str, date_str: str, events: list[dict]):
-    """Populate the Google Doc with structured, formatted content."""
+    The document is built in three phases:
+      1. Assemble the full text and record where formatting + images should go.
+      2. Insert all text and apply paragraph and text styles in one batchUpdate.
+      3. Insert all images in one batchUpdate, working backwards through the
+         document so that each insertion does not shift the indices of the rest.
+    """
+    docs_service, _ = _get_services()
 
-    by_region: dict[str, list[dict]] = {r: [] for r in REGION_ORDER}
-    for event in events:
-        region = event.get("region", "")
-        if region in by_region:
-            by_region[region].append(event)
+    _build_document(docs_service, doc_id, date_str, by_region)
 
-    # -----------------------------------------------------------------------
-    # Phase 1: Build the full text string and record formatting + image slots
-    #
-    # idx is always the next character position in the final document (1-based).
-    # Formatting requests reference these positions; images are inserted later.
-    # -----------------------------------------------------------------------
-    text_parts: list[str] = []
-    format_requests: list[dict] = []
-    image_positions: list[tuple[int, str]] = []  # (doc_index, url)
-
-    idx = 1  # Google Docs body content starts at index 1
-
-    def _para_request(start: int, end: int, style: dict, fields: str) -> dict:
-        return {
-            "updateParagraphStyle": {
-                "range": {"startIndex": start, "endIndex": end},
-                "paragraphStyle": style,
-                "fields": fields,
-            }
+    return f"https://docs.google.com/document/d/{doc_id}/edit"
+
+
+def _para_request(start: int, end: int, style: dict, fields: str) -> dict:
+    return {
+        "updateParagraphStyle": {
+            "range": {"startIndex": start, "endIndex": end},
+            "paragraphStyle": style,
+            "fields": fields,
         }
+    }
 
-    def _text_request(start: int, end: int, style: dict, fields: str) -> dict:
-        return {
-            "updateTextStyle": {
-                "range": {"startIndex": start, "endIndex": end},
-                "textStyle": style,
-                "fields": fields,
-            }
+
+def _text_request(start: int, end: int, style: dict, fields: str) -> dict:
+    return {
+        "updateTextStyle": {
+            "range": {"startIndex": start, "endIndex": end},
+            "textStyle": style,
+            "fields": fields,
         }
+    }
+
+
+class _DocBuilder:
+    """
+    Accumulates the document text along with the formatting requests and image
+    slots that go with it. Each method appends one paragraph.
+
+    idx is always the next character position in the final document (1-based).
+    Formatting requests reference these positions; images are inserted later.
+    """
 
-    def append(
+    def __init__(self) -> None:
+        self._text = io.StringIO()
+        self.format_requests: list[dict] = []
+        self.image_positions: list[tuple[int, str]] = []  # (doc_index, url)
+        self.idx = 1  # Google Docs body content starts at index 1
+
+    def _add(
+        self,
         text: str,
-        *,
-        para_style: str | None = None,
-        space_above: float = 0,
-        space_below: float = 0,
-        alignment: str | None = None,
-        text_color: dict | None = None,
-        link_url: str | None = None,
-        italic: bool = False,
+        para: tuple[dict, str] | None = None,
+        text_style: tuple[dict, str] | None = None,
     ) -> None:
-        nonlocal idx
-        start = idx
-        text_parts.append(text)
-        end = idx + len(text)
-
-        # ── Paragraph style ──────────────────────────────────────────────────
-        para_dict: dict = {}
-        para_fields: list[str] = []
-
-        if para_style:
-            para_dict["namedStyleType"] = para_style
-            para_fields.append("namedStyleType")
-        if space_above:
-            para_dict["spaceAbove"] = {"magnitude": space_above, "unit": "PT"}
-            para_fields.append("spaceAbove")
-        if space_below:
-            para_dict["spaceBelow"] = {"magnitude": space_below, "unit": "PT"}
-            para_fields.append("spaceBelow")
-        if alignment:
-            para_dict["alignment"] = alignment
-            para_fields.append("alignment")
-
-        if para_fields:
-            format_requests.append(_para_request(start, end, para_dict, ",".join(para_fields)))
-
-        # ── Text style (applies to all characters except the trailing \n) ────
-        text_end = end - 1 if text.endswith("\n") else end
-        if text_end > start:
-            text_dict: dict = {}
-            text_fields: list[str] = []
-
-            if text_color:
-                text_dict["foregroundColor"] = {"color": {"rgbColor": text_color}}
-                text_fields.append("foregroundColor")
-            if link_url:
-                text_dict["link"] = {"url": link_url}
-                text_dict["underline"] = True
-                if not text_color:
-                    text_dict["foregroundColor"] = {"color": {"rgbColor": COLOR_LINK}}
-                text_fields += ["link", "underline", "foregroundColor"]
-            if italic:
-                text_dict["italic"] = True
-                text_fields.append("italic")
-
-            if text_fields:
-                format_requests.append(
-                    _text_request(start, text_end, text_dict, ",".join(sorted(set(text_fields))))
-                )
-
-        idx = end
-
-    def reserve_image(url: str | None) -> None:
+        start = self.idx
+        end = start + len(text)
+        self._text.write(text)
+
+        if para:
+            self.format_requests.append(_para_request(start, end, *para))
+        # Text style applies to all characters except the trailing \n
+        if text_style and end - 1 > start:
+            self.format_requests.append(_text_request(start, end - 1, *text_style))
+
+        self.idx = end
+
+    def blank(self) -> None:
+        self._add("\n")
+
+    def title(self, text: str) -> None:
+        self._add(f"{text}\n", _TITLE_PARA)
+
+    def h1(self, text: str) -> None:
+        self._add(f"{text}\n", _H1_PARA, _H1_TEXT)
+
+    def h2(self, text: str) -> None:
+        self._add(f"{text}\n", _H2_PARA, _H2_TEXT)
+
+    def body_para(self, text: str) -> None:
+        self._add(f"{text}\n", _BODY_PARA)
+
+    def link_para(self, text: str, url: str) -> None:
+        self._add(f"{text}\n", _LINK_PARA, ({**_LINK_TEXT, "link": {"url": url}}, _LINK_TEXT_FIELDS))
+
+    def image_slot(self, url: str) -> None:
         """
         Add a dedicated paragraph that will hold the image.
         The paragraph is center-aligned with breathing room above and below,
         so the image never runs into adjacent text.
         """
-        nonlocal idx
-        if not url:
-            return
-
-        start = idx
-        text_parts.append("\n")  # one blank paragraph — the image goes here
-        end = idx + 1
-
-        format_requests.append(_para_request(
-            start, end,
-            {
-                "alignment": "CENTER",
-                "spaceAbove": {"magnitude": 10, "unit": "PT"},
-                "spaceBelow": {"magnitude": 14, "unit": "PT"},
-            },
-            "alignment,spaceAbove,spaceBelow",
-        ))
-
-        # The image is inserted at `start` (the first character of this paragraph),
+        # The image is inserted at the first character of this paragraph,
         # so it fills the paragraph without touching any surrounding text.
-        image_positions.append((start, url))
-        idx = end
+        self.image_positions.append((self.idx, url))
+        self._add("\n", _IMAGE_PARA)  # one blank paragraph — the image goes here
+
+    def text(self) -> str:
+        return self._text.getvalue()
+
+
+def _build_document(docs_service, doc_id: str, date_str: str, by_region: dict[str, list[dict]]):
+    """Populate the Google Doc with structured, formatted content."""
+
+    # -----------------------------------------------------------------------
+    # Phase 1: Build the full text string and record formatting + image slots
+    # -----------------------------------------------------------------------
+    doc = _DocBuilder()
 
     # ── Document title ────────────────────────────────────────────────────────
-    append(
-        f"On This Day — {date_str}\n",
-        para_style="TITLE",
-        alignment="CENTER",
-        space_below=10,
-    )
-    append("\n")  # visual gap under the title
+    doc.title(f"On This Day — {date_str}")
+    doc.blank()  # visual gap under the title
 
     # ── One section per region ────────────────────────────────────────────────
-    for region in REGION_ORDER:
-        region_events = by_region.get(region, [])
+    for region, region_events in by_region.items():
         if not region_events:
             continue
 
-        append(
-            f"{region}\n",
-            para_style="HEADING_1",
-            text_color=COLOR_H1,
-            space_above=20,
-            space_below=6,
-        )
+        doc.h1(region)
 
         for event in region_events:
-            heading_text = f"{event.get('title', '')}  ·  {event.get('year', '')}\n"
-            append(
-                heading_text,
-                para_style="HEADING_2",
-                text_color=COLOR_H2,
-                space_above=16,
-                space_below=4,
-            )
+            doc.h2(f"{event.get('title', '')}  ·  {event.get('year', '')}")
 
             # Image gets its own isolated, centered paragraph
-            reserve_image(event.get("image_url"))
+            image_url = event.get("image_url")
+            if image_url:
+                doc.image_slot(image_url)
 
             # Body paragraphs — justified for a clean editorial look
             body = event.get("body", "").strip()
-            for para in body.split("\n\n"):
-                para = para.strip()
+            for para in _PARAS_RE.split(body):
                 if para:
-                    append(
-                        f"{para}\n",
-                        para_style="NORMAL_TEXT",
-                        alignment="JUSTIFIED",
-                        space_below=8,
-                    )
+                    doc.body_para(para)
 
             wiki_url = event.get("wikipedia_url", "")
             if wiki_url:
-                append(
-                    "Read more →\n",
-                    para_style="NORMAL_TEXT",
-                    link_url=wiki_url,
-                    italic=True,
-                    space_above=4,
-                    space_below=18,
-                )
+                doc.link_para("Read more →", wiki_url)
             else:
-                append("\n")  # gap if no link
+                doc.blank()  # gap if no link
 
-        append("\n")  # gap between regions
+        doc.blank()  # gap between regions
 
-    full_text = "".join(text_parts)
+    full_text = doc.text()
+    format_requests = doc.format_requests
+    image_positions = doc.image_positions
 
     # -----------------------------------------------------------------------
-    # Phase 2: Insert all text in a single request
+    # Phase 2: Insert all text and apply all formatting in one batchUpdate.
+    # Formatting ranges already refer to final positions, and requests within
+    # a batch are applied in order, so they are valid right after the insert.
+    # Only very large documents are split across calls.
     # -----------------------------------------------------------------------
     logger.info(f"Inserting {len(full_text):,} characters into the document")
-    docs_service.documents().batchUpdate(
-        documentId=doc_id,
-        body={"requests": [{"insertText": {"location": {"index": 1}, "text": full_text}}]},
-    ).execute()
+    text_requests = [{"insertText": {"location": {"index": 1}, "text": full_text}}] + format_requests
+    for i in range(0, len(text_requests), BATCH_MAX_REQUESTS):
+        docs_service.documents().batchUpdate(
+            documentId=doc_id,
+            body={"requests": text_requests[i : i + BATCH_MAX_REQUESTS]},
+        ).execute()
+    logger.info(f"Applied {len(format_requests)} formatting requests")
 
     # -----------------------------------------------------------------------
-    # Phase 3: Apply formatting in batches of 50 (API request-size limit)
+    # Phase 3: Insert all images in one batchUpdate — highest index first so
+    # earlier indices stay valid. Kept separate from the text batch so a
+    # rejected image can never take the text down with it. A batchUpdate is
+    # all-or-nothing, so if Google rejects it (e.g. its own fetch of one image
+    # fails), fall back to inserting the images one at a time.
     # -----------------------------------------------------------------------
-    if format_requests:
-        chunk_size = 50
-        for i in range(0, len(format_requests), chunk_size):
-            docs_service.documents().batchUpdate(
-                documentId=doc_id,
-                body={"requests": format_requests[i : i + chunk_size]},
-            ).execute()
-        logger.info(f"Applied {len(format_requests)} formatting requests")
-
-    # -----------------------------------------------------------------------
-    # Phase 4: Insert images — highest index first so earlier indices stay valid
-    # -----------------------------------------------------------------------
-    for img_idx, img_url in sorted(image_positions, key=lambda x: x[0], reverse=True):
+    if not image_positions:
+        return
+
+    image_requests = [
+        {
+            "insertInlineImage": {
+                "location": {"index": img_idx},
+                "uri": img_url,
+                "objectSize": {
+                    "height": {"magnitude": IMAGE_HEIGHT_PT, "unit": "PT"},
+                    "width": {"magnitude": IMAGE_WIDTH_PT, "unit": "PT"},
+                },
+            }
+        }
+        # Slots were recorded in document order, so reversing gives highest index first
+        for img_idx, img_url in reversed(image_positions)
+    ]
+    try:
+        docs_service.documents().batchUpdate(
+            documentId=doc_id,
+            body={"requests": image_requests},
+        ).execute()
+        logger.info(f"Inserted {len(image_requests)} images")
+        return
+    except HttpError as e:
+        logger.warning(f"Image batch rejected, inserting images one at a time: {e}")
+    except (OSError, httplib2.HttpLib2Error) as e:
+        # We can't tell whether the batch was applied, so retrying could
+        # duplicate images — log it and keep the text-only doc
+        logger.error(f"Could not insert images: {e}")
+        return
+
+    for request in image_requests:
+        img_idx = request["insertInlineImage"]["location"]["index"]
+        img_url = request["insertInlineImage"]["uri"]
         try:
             docs_service.documents().batchUpdate(
                 documentId=doc_id,
-                body={
-                    "requests": [{
-                        "insertInlineImage": {
-                            "location": {"index": img_idx},
-                            "uri": img_url,
-                            "objectSize": {
-                                "height": {"magnitude": IMAGE_HEIGHT_PT, "unit": "PT"},
-                                "width": {"magnitude": IMAGE_WIDTH_PT, "unit": "PT"},
-                            },
-                        }
-                    }]
-                },
+                body={"requests": [request]},
             ).execute()
             logger.info(f"Inserted image at index {img_idx}")
-        except Exception as e:
+        except (HttpError, OSError, httplib2.HttpLib2Error) as e:
             logger.error(f"Could not insert image at index {img_idx} ({img_url}): {e}")
@@ -2,22 +2,25 @@
 On This Day — daily history digest
 ===================================
 Orchestrates the full pipeline:
-  1. Generate historical events for today via the Anthropic API
-  2. Fetch a Wikimedia Commons image for each event
-  3. Create a formatted Google Doc with all content
-  4. Post a summary to Discord
+  1. Generate historical events for today via the Anthropic API (streamed)
+  2. Create a blank Google Doc
+  3. Fetch a Wikimedia Commons image for each event — lookups start while
+     Claude is still writing and run in parallel with the doc creation
+  4. Fill the Google Doc with formatted content
+  5. Post a summary to Discord
 """
 
 import logging
 import sys
-from datetime import datetime
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
 
 from dotenv import load_dotenv
 
 from discord_notifier import post_digest
-from generator import generate_events
-from google_drive import create_daily_doc
-from wikimedia import find_image_url
+from generator import REGION_ORDER, generate_events
+from google_drive import create_blank_doc, populate_doc
+from wikimedia import find_image_url, forget_image_url, is_image_usable
 
 # Load .env for local development — no-op in GitHub Actions (secrets are env vars)
 load_dotenv()
@@ -30,28 +33,73 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Upper bound on parallel Wikimedia lookups (wikimedia.py caps requests in flight)
+MAX_IMAGE_WORKERS = 8
+
+
+def _lookup_image(query: str) -> str | None:
+    url = find_image_url(query)
+    # Google Docs rejects the whole image batch if any URL fails — drop bad links
+    # now. This runs in the lookup's worker thread, so the checks happen in parallel.
+    if url and not is_image_usable(url):
+        logger.warning(f"Dropping unusable image for {query!r}: {url}")
+        forget_image_url(query)  # don't keep serving it from the cache
+        return None
+    return url
+
 
 def main() -> None:
-    date = datetime.utcnow()
-    logger.info(f"Starting digest for {date.strftime('%B %d, %Y')} UTC")
+    # Format the date once; every step below takes the pre-formatted strings
+    now = datetime.now(timezone.utc)
+    date_label = f"{now:%B} {now.day}"  # e.g. "March 15" — what Claude is asked about
+    date_str = f"{date_label}, {now.year}"  # e.g. "March 15, 2026" — used in headers
+    logger.info(f"Starting digest for {date_str} UTC")
+
+    # One extra worker for the Google Doc creation alongside the image lookups
+    with ThreadPoolExecutor(max_workers=MAX_IMAGE_WORKERS + 1) as executor:
+        image_futures: dict[str, Future] = {}  # search query -> image URL
+
+        def start_image_lookup(event: dict) -> None:
+            # Events outside REGION_ORDER are dropped below — don't fetch images for them
+            if event.get("region", "") not in REGION_ORDER:
+                return
+            query = event.get("wikimedia_search_query", "").strip()
+            if query and query not in image_futures:
+                image_futures[query] = executor.submit(_lookup_image, query)
+
+        # Step 1: Generate events — each event's image lookup starts as soon as
+        # it has streamed in, while Claude is still writing the rest
+        events = generate_events(date_label, on_event=start_image_lookup)
+        if not events:
+            logger.warning("Claude returned no events for today. Nothing to publish.")
+            return
+
+        # Step 2: Create the blank Google Doc — needs nothing but the date
+        doc_future = executor.submit(create_blank_doc, date_str)
+
+        # Step 3: Attach a Wikimedia image URL to each event. The final event list
+        # is re-parsed from the full response, so start any lookup the stream missed.
+        for event in events:
+            start_image_lookup(event)
+            future = image_futures.get(event.get("wikimedia_search_query", "").strip())
+            event["image_url"] = future.result() if future else None
 
-    # Step 1: Generate events
-    events = generate_events(date)
-    if not events:
-        logger.warning("Claude returned no events for today. Nothing to publish.")
-        return
+        doc_id = doc_future.result()
 
-    # Step 2: Attach a Wikimedia image URL to each event
+    # Group once, in display order, for both the doc and the Discord post.
+    # Events in a region we don't cover are left out of both.
+    by_region: dict[str, list[dict]] = {region: [] for region in REGION_ORDER}
     for event in events:
-        query = event.get("wikimedia_search_query", "").strip()
-        event["image_url"] = find_image_url(query) if query else None
+        region = event.get("region", "")
+        if region in by_region:
+            by_region[region].append(event)
 
-    # Step 3: Create the Google Doc
-    doc_url = create_daily_doc(date, events)
+    # Step 4: Fill in the Google Doc
+    doc_url = populate_doc(doc_id, date_str, by_region)
     logger.info(f"Document ready: {doc_url}")
 
-    # Step 4: Post to Discord
-    post_digest(date, events, doc_url)
+    # Step 5: Post to Discord
+    post_digest(date_str, by_region, doc_url)
 
     logger.info("Digest complete.")
 
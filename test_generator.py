@@ -0,0 +1,62 @@
+"""
+Unit tests for the incremental event parser in generator.py.
+
+Run with: python -m unittest
+"""
+
+import json
+import unittest
+
+from generator import _EventStreamParser
+
+EVENTS = [
+    {
+        "region": "Ancient Rome",
+        "title": "Braces {inside} [strings] don't count",
+        "year": "44 BC",
+        "teaser": 'He said \"beware\" — and a stray backslash \\ too.',
+        "body": "First paragraph.\n\nSecond paragraph with a } and a ].",
+        "wikipedia_url": "https://en.wikipedia.org/wiki/Assassination_of_Julius_Caesar",
+        "wikimedia_search_query": "Roman Senate ancient fresco",
+    },
+    {
+        "region": "United States",
+        "title": "Nested values",
+        "year": "1776",
+        "teaser": "Ends in an escaped quote \"",
+        "body": "Plain.",
+        "extra": {"list": [1, {"deep": "}{"}], "empty": {}},
+    },
+]
+
+FENCED_RESPONSE = "```json\n" + json.dumps({"events": EVENTS}, indent=2, ensure_ascii=False) + "\n```"
+
+
+def _feed_in_chunks(text: str, size: int) -> list[dict]:
+    parser = _EventStreamParser()
+    events = []
+    for i in range(0, len(text), size):
+        events += parser.feed(text[i : i + size])
+    return events
+
+
+class EventStreamParserTest(unittest.TestCase):
+    def test_yields_each_event_whatever_the_chunk_size(self):
+        for size in (1, 2, 3, 7, 16, 64, len(FENCED_RESPONSE)):
+            with self.subTest(chunk_size=size):
+                self.assertEqual(_feed_in_chunks(FENCED_RESPONSE, size), EVENTS)
+
+    def test_emits_an_event_as_soon_as_its_object_closes(self):
+        parser = _EventStreamParser()
+        first = json.dumps(EVENTS[0])
+        self.assertEqual(parser.feed('{"events": [' + first[:-1]), [])
+        self.assertEqual(parser.feed(first[-1]), [EVENTS[0]])
+        self.assertEqual(parser.feed(", " + json.dumps(EVENTS[1]) + "]}"), [EVENTS[1]])
+
+    def test_incomplete_response_yields_only_finished_events(self):
+        truncated = FENCED_RESPONSE[: FENCED_RESPONSE.index('"Nested values"')]
+        self.assertEqual(_feed_in_chunks(truncated, 5), EVENTS[:1])
+
+
+if __name__ == "__main__":
+    unittest.main()
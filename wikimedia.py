@@ -1,92 +1,199 @@
+import functools
+import json
 import logging
+import os
+import shelve
+import threading
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from orjson import loads as json_loads
+except ImportError:  # orjson is optional — fall back to the standard library parser
+    from json import loads as json_loads
 
 logger = logging.getLogger(__name__)
 
 COMMONS_API = "https://commons.wikimedia.org/w/api.php"
 ALLOWED_MIME_TYPES = {"image/jpeg", "image/png"}
+# Skip absurdly large files — Google Docs will reject them
+MAX_IMAGE_BYTES = 25_000_000
 
 # Wikimedia requires a descriptive User-Agent — edit the contact address if you fork this
 HEADERS = {
     "User-Agent": "OnThisDayDigest/1.0 (https://github.com/; history-digest-bot)"
 }
 
+# Lookups for several events run in parallel — cap the number of requests in
+# flight to Commons at any one time to respect Wikimedia's API etiquette
+MAX_CONCURRENT_REQUESTS = 4
+_request_slots = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+
+# One pooled session for every call so keep-alive connections (and their TLS
+# sessions) are reused across lookups instead of re-handshaking each time
+_session = requests.Session()
+_session.headers.update(HEADERS)
+_session.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=16))
+
+# ── Lookup cache ──────────────────────────────────────────────────────────────
+# Results (including "nothing found") are kept on disk keyed by search query,
+# so re-running a day's digest does not hit the Commons API again
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "wikimedia.db")
+CACHE_TTL_SECONDS = 30 * 24 * 60 * 60  # 30 days
+_cache_lock = threading.Lock()
+
 
 def find_image_url(query: str) -> str | None:
     """
     Search Wikimedia Commons for an image matching the query.
     Returns a direct HTTPS URL to the image file, or None if nothing suitable is found.
+    Safe to call from multiple threads.
+
+    Results are served from the in-process and on-disk caches when available;
+    API errors are never cached, so a failed lookup is retried on the next run.
     """
     try:
-        search_resp = requests.get(
-            COMMONS_API,
-            headers=HEADERS,
-            params={
-                "action": "query",
-                "list": "search",
-                "srnamespace": 6,  # File namespace only
-                "srsearch": query,
-                "format": "json",
-                "srlimit": 8,
-            },
-            timeout=10,
-        )
-        search_resp.raise_for_status()
-        results = search_resp.json().get("query", {}).get("search", [])
+        return _cached_lookup(query)
+    except (requests.RequestException, json.JSONDecodeError) as e:
+        logger.error(f"Wikimedia API error for {query!r}: {e}")
+        return None
 
-        if not results:
-            logger.warning(f"No Wikimedia results for query: {query!r}")
-            return None
 
-        for result in results:
-            page_title = result["title"]  # e.g. "File:Julius Caesar.jpg"
-            url = _get_image_url(page_title)
-            if url:
-                logger.info(f"Found image for {query!r}: {url}")
-                return url
+@functools.lru_cache(maxsize=512)
+def _cached_lookup(query: str) -> str | None:
+    """Check the disk cache, falling back to a live search. Raises on API or decode errors."""
+    entry = _cache_get(query)
+    if entry is not None:
+        stored_at, url = entry
+        if time.time() - stored_at < CACHE_TTL_SECONDS:
+            logger.info(f"Using cached image for {query!r}: {url}")
+            return url
 
-        logger.warning(f"No suitable images found for query: {query!r}")
-        return None
+    url = _search_commons(query)
+    _cache_put(query, (time.time(), url))
+    return url
 
-    except requests.RequestException as e:
-        logger.error(f"Wikimedia API error for {query!r}: {e}")
+
+def _open_cache() -> shelve.Shelf:
+    os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+    return shelve.open(CACHE_PATH)
+
+
+def _cache_get(query: str) -> tuple[float, str | None] | None:
+    # A damaged shelf can raise almost anything while unpickling (EOFError,
+    # UnpicklingError, ...) — any failure here is treated as a cache miss
+    try:
+        with _cache_lock, _open_cache() as db:
+            stored_at, url = db[query]
+        return float(stored_at), url
+    except KeyError:
+        return None
+    except Exception as e:
+        logger.warning(f"Wikimedia cache unreadable, skipping read: {e}")
         return None
 
 
-def _get_image_url(page_title: str) -> str | None:
-    """Fetch the direct file URL for a Wikimedia Commons file page."""
+def _cache_put(query: str, entry: tuple[float, str | None]) -> None:
     try:
-        resp = requests.get(
+        with _cache_lock, _open_cache() as db:
+            db[query] = entry
+    except Exception as e:
+        logger.warning(f"Wikimedia cache unavailable, skipping write: {e}")
+
+
+def _cache_delete(query: str) -> None:
+    try:
+        with _cache_lock, _open_cache() as db:
+            db.pop(query, None)
+    except Exception as e:
+        logger.warning(f"Wikimedia cache unavailable, skipping delete: {e}")
+
+
+def forget_image_url(query: str) -> None:
+    """
+    Drop the cached result for a query, e.g. because the URL it returned failed
+    is_image_usable(). The next run searches Commons afresh instead of serving
+    the bad URL for the rest of the cache TTL.
+    """
+    _cache_delete(query)
+
+
+def _search_commons(query: str) -> str | None:
+    """
+    Run the live Commons search. Uses the search results as a generator for
+    imageinfo, so the candidate files and their URL/MIME/size come back in a
+    single API round-trip.
+    """
+    with _request_slots:
+        resp = _session.get(
             COMMONS_API,
-            headers=HEADERS,
             params={
                 "action": "query",
+                "generator": "search",
+                "gsrnamespace": 6,  # File namespace only
+                "gsrsearch": query,
+                "gsrlimit": 8,
                 "prop": "imageinfo",
                 "iiprop": "url|mime|size",
-                "titles": page_title,
                 "format": "json",
             },
             timeout=10,
         )
-        resp.raise_for_status()
-        pages = resp.json().get("query", {}).get("pages", {})
-
-        for page in pages.values():
-            for info in page.get("imageinfo", []):
-                mime = info.get("mime", "")
-                url = info.get("url", "")
-                size = info.get("size", 0)
-
-                if mime not in ALLOWED_MIME_TYPES:
-                    continue
-                # Skip absurdly large files (> 25 MB) — Google Docs will reject them
-                if size > 25_000_000:
-                    continue
-                if url.startswith("https://"):
-                    return url
+    resp.raise_for_status()
+    pages = json_loads(resp.content).get("query", {}).get("pages", {})
 
+    if not pages:
+        logger.warning(f"No Wikimedia results for query: {query!r}")
         return None
 
+    # Pages come back keyed by page ID — restore the search ranking
+    for page in sorted(pages.values(), key=lambda p: p.get("index", 0)):
+        for info in page.get("imageinfo", []):
+            mime = info.get("mime", "")
+            url = info.get("url", "")
+            size = info.get("size", 0)
+
+            if mime not in ALLOWED_MIME_TYPES:
+                continue
+            if size > MAX_IMAGE_BYTES:
+                continue
+            if url.startswith("https://"):
+                logger.info(f"Found image for {query!r}: {url}")
+                return url
+
+    logger.warning(f"No suitable images found for query: {query!r}")
+    return None
+
+
+def is_image_usable(url: str) -> bool:
+    """
+    Check with a cheap HEAD request that the image URL still serves a JPEG/PNG
+    within the size limit, so bad links are dropped before they are handed to
+    Google Docs (which would otherwise reject the whole image batch).
+    """
+    try:
+        with _request_slots:
+            resp = _session.head(url, allow_redirects=True, timeout=5)
     except requests.RequestException as e:
-        logger.error(f"Wikimedia imageinfo error for {page_title!r}: {e}")
-        return None
+        logger.warning(f"Could not reach image {url}: {e}")
+        return False
+
+    if not resp.ok:
+        logger.warning(f"Image {url} returned HTTP {resp.status_code}")
+        return False
+
+    mime = resp.headers.get("Content-Type", "").split(";")[0].strip().lower()
+    if mime not in ALLOWED_MIME_TYPES:
+        logger.warning(f"Image {url} has unsupported type {mime!r}")
+        return False
+
+    # Content-Length may be missing (e.g. chunked responses) — the size was
+    # already checked against Commons' metadata, so only reject a known excess
+    length = resp.headers.get("Content-Length", "")
+    if length.isdigit() and int(length) > MAX_IMAGE_BYTES:
+        logger.warning(f"Image {url} is too large ({int(length):,} bytes)")
+        return False
+
+    return True